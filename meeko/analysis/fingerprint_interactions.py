@@ -5,13 +5,34 @@
 #
 
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
+from scipy import sparse
 
 from .interactions import Hydrophobic, Reactive, Metal
 from .interactions import HBDonor, HBAcceptor, WaterDonor, WaterAcceptor
 
+# Interaction types for which the atom name is part of the identity
+_named_interactions = ['HBDonor', 'HBAcceptor', 'WaterDonor', 'WaterAcceptor']
+
+# Worker state for the parallel pose loop, the FingerprintInteractions object
+# (and so the receptor) and the molecule are pickled once per worker instead
+# of once per pose
+_worker_fpi = None
+_worker_molecule = None
+
+
+def _init_pose_worker(fpi, molecule):
+    global _worker_fpi, _worker_molecule
+    _worker_fpi = fpi
+    _worker_molecule = molecule
+
+
+def _run_pose_worker(pose_id):
+    return _worker_fpi._run_pose(_worker_molecule[pose_id])
+
 
 class FingerprintInteractions:
 
@@ -25,17 +46,102 @@ class FingerprintInteractions:
         self._data = []
         self._interactions = [Hydrophobic(),
                               Reactive(),
-                              Metal(), 
+                              Metal(),
                               HBDonor(), HBAcceptor(),
                               WaterDonor(), WaterAcceptor()]
         self._unique_interactions = {interaction.name: {*()} for interaction in self._interactions}
+        # Each interaction (interaction type, chain, resid[, name]) is packed
+        # into a single int64 key, hashing ints is much cheaper than hashing
+        # formatted strings; the string labels are built only once in to_dataframe
+        self._name_ids = {}
+        self._names = []
         self._receptor = receptor
 
-    def run(self, molecules):
+    def _name_id(self, name):
+        """Return the integer id for one atom name, assigning a new one if needed."""
+        try:
+            return self._name_ids[name]
+        except KeyError:
+            new_id = len(self._names)
+            if new_id > 0xFFFF:
+                raise OverflowError('Too many unique atom names to pack interaction keys')
+            self._name_ids[name] = new_id
+            self._names.append(str(name))
+            return new_id
+
+    def _pack_interactions(self, kind_code, rec_atoms, with_name):
+        """Pack interactions as int64 keys: kind (1 byte), chain (1 byte),
+        resid (4 bytes), atom name id (2 bytes). All vectorized."""
+        # The chain is a single character ('U1'), its codepoint is its bytes
+        chains = rec_atoms['chain'].astype('U1').view(np.uint32).astype(np.int64) & 0xFF
+        resids = rec_atoms['resid'].astype(np.int64) & 0xFFFFFFFF
+        keys = (kind_code << 56) | (chains << 48) | (resids << 16)
+
+        if with_name:
+            unique_names, name_to_unique = np.unique(rec_atoms['name'], return_inverse=True)
+            name_ids = np.array([self._name_id(name) for name in unique_names], dtype=np.int64)
+            keys |= name_ids[name_to_unique]
+
+        return keys
+
+    def _unpack_interaction(self, key, with_name):
+        """Unpack one int64 key back into its 'chain:resid[:name]' label."""
+        chain_code = (key >> 48) & 0xFF
+        chain = chr(chain_code) if chain_code else ''
+        resid = (key >> 16) & 0xFFFFFFFF
+        if resid >= 0x80000000:
+            resid -= 0x100000000
+        label = '%s:%d' % (chain, resid)
+        if with_name:
+            label += ':%s' % self._names[key & 0xFFFF]
+        return label
+
+    def _run_pose(self, pose):
+        """Collect the interacting receptor atoms (chain, resid, name) for one pose."""
+        tables = {}
+
+        for interaction in self._interactions:
+            rigid_interactions, flex_interactions = interaction.find(pose, self._receptor)
+
+            rec_rigid_atoms = self._receptor.atoms(rigid_interactions['receptor_idx'])
+            rec_flex_atoms = pose.atoms(flex_interactions['receptor_idx'])
+
+            tables[interaction.name] = [rec_atoms[['chain', 'resid', 'name']]
+                                        for rec_atoms in (rec_rigid_atoms, rec_flex_atoms)
+                                        if rec_atoms.size > 0]
+
+        return pose.name, pose.pose_id, tables
+
+    def _collect_pose(self, name, pose_id, tables):
+        """Pack the interacting atoms of one pose into unique int64 keys.
+
+        Packing (and so the atom name interning) always happens in the main
+        process, the keys stay consistent when poses are run in parallel.
+        """
+        tmp_data = [name, pose_id]
+
+        for kind_code, interaction in enumerate(self._interactions):
+            with_name = interaction.name in _named_interactions
+            keys = [self._pack_interactions(kind_code, rec_atoms, with_name)
+                    for rec_atoms in tables[interaction.name]]
+
+            if keys:
+                resids = np.unique(np.concatenate(keys)).tolist()
+            else:
+                resids = []
+
+            self._unique_interactions[interaction.name].update(resids)
+            tmp_data.append(resids)
+
+        return tmp_data
+
+    def run(self, molecules, max_workers=1):
         """Run the fingerprint interactions.
-        
+
         Args:
             molecules (PDBQTMolecule, list of PDBQTMolecule): molecule or list of molecules
+            max_workers (int): number of processes to run poses in parallel
+                (default: 1, serial)
 
         """
         data = []
@@ -44,36 +150,16 @@ class FingerprintInteractions:
             molecules = [molecules]
 
         for molecule in molecules:
-            for pose in molecule:
-                tmp = {}
-
-                for interaction in self._interactions:
-                    resids = ''
-                    columns = ['chain', 'resid']
-                    if interaction.name in ['HBDonor', 'HBAcceptor', 'WaterDonor', 'WaterAcceptor']:
-                        columns += ['name']
-
-                    rigid_interactions, flex_interactions = interaction.find(pose, self._receptor)
-
-                    rec_rigid_atoms = self._receptor.atoms(rigid_interactions['receptor_idx'])
-                    rec_flex_atoms = pose.atoms(flex_interactions['receptor_idx'])
-
-                    if rec_rigid_atoms.size > 0:
-                        unique_resids = np.unique(rec_rigid_atoms[columns])
-                        resids = [':'.join([interaction.name] + [str(v) for v in u]) for u in unique_resids]
-
-                    if rec_flex_atoms.size > 0:
-                        unique_resids = np.unique(rec_flex_atoms[columns])
-                        resids += [':'.join([interaction.name] + [str(v) for v in u]) for u in unique_resids]
-
-                    tmp[interaction.name] = resids
-
-                tmp_data = [pose.name, pose.pose_id]
-                for inte_type, resids in tmp.items():
-                    unique_resids = set(resids)
-                    self._unique_interactions[inte_type].update(unique_resids)
-                    tmp_data.append(list(unique_resids))
-                data.append(tmp_data)
+            if max_workers == 1:
+                results = (self._run_pose(pose) for pose in molecule)
+                data.extend(self._collect_pose(*result) for result in results)
+            else:
+                pose_ids = [pose.pose_id for pose in molecule]
+                with ProcessPoolExecutor(max_workers=max_workers,
+                                         initializer=_init_pose_worker,
+                                         initargs=(self, molecule)) as executor:
+                    for result in executor.map(_run_pose_worker, pose_ids):
+                        data.append(self._collect_pose(*result))
 
         self._data.extend(data)
 
@@ -96,10 +182,12 @@ class FingerprintInteractions:
         poses = []
 
         # Generate one-hot encoder-like (and the columns for the dataframe)
+        # The interaction labels are built only here, once per unique interaction
         for inte_type, resids in self._unique_interactions.items():
             columns[0].extend([inte_type] * len(resids))
-            # Remove the v/w/h_ tag for the column names
-            columns[1].extend([resid.split(':', 1)[-1] for resid in resids])
+            # The interaction type is not repeated in the column names
+            with_name = inte_type in _named_interactions
+            columns[1].extend([self._unpack_interaction(resid, with_name) for resid in resids])
 
             for resid in resids:
                 resid_to_idx_encoder[resid] = count
@@ -110,15 +198,21 @@ class FingerprintInteractions:
         multi_columns = pd.MultiIndex.from_tuples(c_tuples)
 
         # Convert resids in one hot fingerprint interactions
-        fpi = np.zeros(shape=(len(self._data), count), dtype=int)
+        # Build a sparse COO matrix instead of filling a dense array row-by-row,
+        # 8-bit ints are enough for a one-hot encoding
+        rows = []
+        cols = []
 
         for i, pose_molecule in enumerate(self._data):
-            resids = [j for i in pose_molecule[2:] for j in i]
-            idx = [resid_to_idx_encoder[resid] for resid in resids]
-            fpi[i][idx] = 1
+            idx = [resid_to_idx_encoder[resid] for resids in pose_molecule[2:] for resid in resids]
+            rows.extend([i] * len(idx))
+            cols.extend(idx)
             names.append(pose_molecule[0])
             poses.append(pose_molecule[1] + 1)
 
+        fpi = sparse.coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)),
+                                shape=(len(self._data), count)).toarray()
+
         # Create final dataframe
         df = pd.DataFrame(fpi, index=np.arange(0, len(self._data)), columns=multi_columns)
         
@@ -4,18 +4,119 @@
 # Meeko - Interactions
 #
 
+import math
 import os
 from abc import ABC, abstractmethod
 
 import numpy as np
 
-
-def _compute_angle(v1, v2):
-    unit_vector_1 = v1 / np.linalg.norm(v1)
-    unit_vector_2 = v2 / np.linalg.norm(v2)
-    dot_product = np.dot(unit_vector_1, unit_vector_2)
-    angle = np.arccos(dot_product)
-    return angle
+try:
+    from numba import njit, prange
+except ImportError:
+    _has_numba = False
+else:
+    _has_numba = True
+
+
+def _compute_cosines(v1, v2):
+    """Compute cosines of the angles between two (K, 3) batches of vectors at once."""
+    dot_products = np.einsum('ij,ij->i', v1, v2)
+    norms = np.linalg.norm(v1, axis=1) * np.linalg.norm(v2, axis=1)
+    return np.clip(dot_products / norms, -1., 1.)
+
+
+def _check_hb_angles_numpy(lig_xyz, rec_xyz, lig_pre_positions, lig_has_pre_position,
+                           rec_pre_positions, rec_has_pre_position, angle_1_cutoff, angle_2_cutoff):
+    """Compute both hydrogen bond angles for (K, 3) batches of candidate pairs.
+
+    Atoms without pre-position (like water molecules) get the always-valid
+    180 degrees.
+
+    Returns a (K,) boolean array of the pairs satisfying the angle criteria
+    and the two (K,) arrays of angles in radians (only meaningful for the
+    accepted pairs).
+
+    """
+    lig_to_rec_vectors = lig_xyz - rec_xyz
+    n_pairs = lig_xyz.shape[0]
+
+    # Work on cosines, arccos is monotone decreasing on [0, 180] so
+    # angle >= cutoff is the same as cos(angle) <= cos(cutoff), and the
+    # expensive arccos is only paid at the end for the accepted pairs.
+    # Missing pre-positions keep the always-valid cos(180) = -1.
+    cos_1 = np.full(n_pairs, -1.)
+    if np.any(lig_has_pre_position):
+        lig_vectors = lig_xyz[lig_has_pre_position] - lig_pre_positions[lig_has_pre_position]
+        cos_1[lig_has_pre_position] = _compute_cosines(lig_vectors, lig_to_rec_vectors[lig_has_pre_position])
+
+    accepted = cos_1 <= np.cos(angle_1_cutoff)
+
+    # Short-circuit, the second angle is only computed for the pairs that
+    # passed the first one
+    cos_2 = np.full(n_pairs, -1.)
+    second_angle = accepted & rec_has_pre_position
+    if np.any(second_angle):
+        rec_vectors = rec_xyz[second_angle] - rec_pre_positions[second_angle]
+        cos_2[second_angle] = _compute_cosines(rec_vectors, -lig_to_rec_vectors[second_angle])
+
+    accepted &= cos_2 <= np.cos(angle_2_cutoff)
+
+    angles_1 = np.full(n_pairs, np.pi)
+    angles_2 = np.full(n_pairs, np.pi)
+    angles_1[accepted] = np.arccos(cos_1[accepted])
+    angles_2[accepted] = np.arccos(cos_2[accepted])
+
+    return accepted, angles_1, angles_2
+
+
+if _has_numba:
+    @njit(cache=True, fastmath=True, parallel=True)
+    def _check_hb_angles(lig_xyz, rec_xyz, lig_pre_positions, lig_has_pre_position,
+                         rec_pre_positions, rec_has_pre_position, angle_1_cutoff, angle_2_cutoff):
+        n_pairs = lig_xyz.shape[0]
+        accepted = np.zeros(n_pairs, dtype=np.bool_)
+        angles_1 = np.full(n_pairs, np.pi)
+        angles_2 = np.full(n_pairs, np.pi)
+        # Compare cosines instead of angles (arccos is monotone decreasing),
+        # acos is only paid for the accepted pairs
+        cos_cutoff_1 = math.cos(angle_1_cutoff)
+        cos_cutoff_2 = math.cos(angle_2_cutoff)
+
+        for k in prange(n_pairs):
+            vx = lig_xyz[k, 0] - rec_xyz[k, 0]
+            vy = lig_xyz[k, 1] - rec_xyz[k, 1]
+            vz = lig_xyz[k, 2] - rec_xyz[k, 2]
+            norm_v = math.sqrt(vx * vx + vy * vy + vz * vz)
+
+            cos_1 = -1.
+            if lig_has_pre_position[k]:
+                ax = lig_xyz[k, 0] - lig_pre_positions[k, 0]
+                ay = lig_xyz[k, 1] - lig_pre_positions[k, 1]
+                az = lig_xyz[k, 2] - lig_pre_positions[k, 2]
+                norm_a = math.sqrt(ax * ax + ay * ay + az * az)
+                cos_1 = max(-1., min(1., (ax * vx + ay * vy + az * vz) / (norm_a * norm_v)))
+
+            if cos_1 > cos_cutoff_1:
+                continue
+
+            cos_2 = -1.
+            if rec_has_pre_position[k]:
+                bx = rec_xyz[k, 0] - rec_pre_positions[k, 0]
+                by = rec_xyz[k, 1] - rec_pre_positions[k, 1]
+                bz = rec_xyz[k, 2] - rec_pre_positions[k, 2]
+                norm_b = math.sqrt(bx * bx + by * by + bz * bz)
+                cos_2 = max(-1., min(1., -(bx * vx + by * vy + bz * vz) / (norm_b * norm_v)))
+
+            if cos_2 > cos_cutoff_2:
+                continue
+
+            accepted[k] = True
+            angles_1[k] = math.acos(cos_1)
+            angles_2[k] = math.acos(cos_2)
+
+        return accepted, angles_1, angles_2
+else:
+    _check_hb_angles = _check_hb_angles_numpy
 
 
 class _Interaction(ABC):
@@ -56,25 +157,53 @@ class _DistanceBased(_Interaction):
                 for each interaction between ligand and flexible sidechain
 
         """
-        dtype = [('ligand_idx', int), ('receptor_idx', int), 
+        dtype = [('ligand_idx', int), ('receptor_idx', int),
                  ('distance', float)]
-        rigid_interactions = [] 
+        rigid_interactions = []
         flex_interactions = []
         has_flexible_residues = ligand.has_flexible_residues()
-        lig_atoms = ligand.atoms_by_properties(['ligand', self._atom_properties[0]])
+        # Work on plain index and coordinate arrays, iterating structured
+        # arrays record-by-record is expensive
+        lig_indices = ligand.indices_by_properties(['ligand', self._atom_properties[0]])
+
+        if lig_indices.size == 0:
+            return np.array(rigid_interactions, dtype=dtype), np.array(flex_interactions, dtype=dtype)
+
+        lig_positions = ligand.coordinates[lig_indices]
 
-        for lig_atom in lig_atoms:
-            # Get interactions with the rigid part of the receptor
-            rec_atoms = receptor.closest_atoms_from_positions(lig_atom['xyz'], self._distance, self._atom_properties[1])
-            rigid_interactions.extend((lig_atom['idx'], rec_atom['idx'], np.linalg.norm(lig_atom['xyz'] - rec_atom['xyz'])) for rec_atom in rec_atoms)
+        # Get all the neighbors at once, one KDTree query for all the ligand
+        # atoms, then compute all the distances in a single vectorized pass
+        rigid_neighbors = receptor.closest_atom_indices_from_positions(lig_positions, self._distance, self._atom_properties[1])
+        rigid_interactions = self._find_pairs(lig_indices, lig_positions, receptor, rigid_neighbors)
 
-            # Get interactions with the flexible part of the receptor (if present)
-            if has_flexible_residues:
-                rec_atoms = ligand.closest_atoms_from_positions(lig_atom['xyz'], self._distance, ['flexible_residue', self._atom_properties[1]])
-                flex_interactions.extend((lig_atom['idx'], rec_atom['idx'], np.linalg.norm(lig_atom['xyz'] - rec_atom['xyz'])) for rec_atom in rec_atoms)
+        # Get interactions with the flexible part of the receptor (if present)
+        if has_flexible_residues:
+            flex_neighbors = ligand.closest_atom_indices_from_positions(lig_positions, self._distance, ['flexible_residue', self._atom_properties[1]])
+            flex_interactions = self._find_pairs(lig_indices, lig_positions, ligand, flex_neighbors)
 
         return np.array(rigid_interactions, dtype=dtype), np.array(flex_interactions, dtype=dtype)
 
+    def _find_pairs(self, lig_indices, lig_positions, rec, neighbors):
+        """Compute the distances of all the (ligand, receptor) pairs at once.
+
+        The KDTree query already guarantees the pairs are within the distance
+        cutoff, so no further filtering is needed.
+
+        """
+        # Turn the per-ligand-atom neighbor lists into two aligned arrays of
+        # candidate pairs
+        pair_lig = np.repeat(np.arange(lig_indices.shape[0]), [len(n) for n in neighbors])
+
+        if pair_lig.size == 0:
+            return []
+
+        pair_rec = np.concatenate(neighbors)
+
+        vectors = lig_positions[pair_lig] - rec.coordinates[pair_rec]
+        distances = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+
+        return list(zip(lig_indices[pair_lig].tolist(), pair_rec.tolist(), distances.tolist()))
+
 
 class Hydrophobic(_DistanceBased):
     def __init__(self, distance=4.5):
@@ -117,8 +246,12 @@ class _HBBased(_Interaction):
         assert len(atom_properties) == 2, 'An array-like of two atom properties must be defined'
 
         self._distance = distance
+        self._distance_sq = distance * distance
         self._angles = [np.radians(angle) for angle in angles]
         self._atom_properties = atom_properties
+        # Lazily cached (receptor, pre_positions, has_pre_position), the
+        # receptor topology is static so they are computed only once
+        self._rec_pre_positions = None
 
     @property
     def name(self):
@@ -138,85 +271,151 @@ class _HBBased(_Interaction):
                 for each interaction between ligand and flexible sidechain
 
         """
-        dtype = [('ligand_idx', int), ('receptor_idx', int), 
+        dtype = [('ligand_idx', int), ('receptor_idx', int),
                  ('distance', float), ('angle_don', float), ('angle_acc', float)]
-        rigid_interactions = []
-        flex_interactions = []
-        lig_hb_pre_position = None
-        rec_hb_pre_position = None
         lig_atom_property, rec_atom_property = self._atom_properties
 
         has_flexible_residues = ligand.has_flexible_residues()
 
         if lig_atom_property == 'water':
-            lig_atoms = ligand.atoms_by_properties([lig_atom_property])
+            lig_indices = ligand.indices_by_properties([lig_atom_property])
         else:
-            lig_atoms = ligand.atoms_by_properties(['ligand', lig_atom_property])
-
-        for lig_atom in lig_atoms:
-            # Get pre-acceptor position (if acceptor) or pre-hydrogen position (if donor) for that atom in the ligand
-            lig_bound_atoms_index = ligand.neighbor_atoms(lig_atom['idx'])
-            if any(lig_bound_atoms_index):
-                lig_bound_atoms = ligand.atoms(lig_bound_atoms_index[0])
-                # This is not accurate when bonds don't have the same length
-                lig_hb_pre_position = np.mean(lig_bound_atoms['xyz'], axis=0)
-            else:
-                # If no atom bound, likely a water molecule attached to the ligand
-                lig_hb_pre_position = None
-
-            # Get rigid part of the receptor
-            rec_rigid_atoms = receptor.closest_atoms_from_positions(lig_atom['xyz'], self._distance, rec_atom_property)
-            rec_rigid_flex = [receptor]
-            rec_rigid_flex_atoms = [rec_rigid_atoms]
-            rec_rigid_flex_types = ['rigid']
-
-            # Get the flexible part of the receptor (if present)
-            if has_flexible_residues:
-                rec_flex_atoms = ligand.closest_atoms_from_positions(lig_atom['xyz'], self._distance, ['flexible_residue', rec_atom_property])
-                rec_rigid_flex.append(ligand)
-                rec_rigid_flex_atoms.append(rec_flex_atoms)
-                rec_rigid_flex_types.append('flex')
-
-            # Add interactions
-            for rec, rec_atoms, rec_type in zip(rec_rigid_flex, rec_rigid_flex_atoms, rec_rigid_flex_types):
-                for rec_atom in rec_atoms:
-                    distance = np.linalg.norm(lig_atom['xyz'] - rec_atom['xyz'])
-
-                    if distance <= self._distance:
-                        # Get pre-acceptor position (if acceptor) or pre-hydrogen position (if donor) for that atom in the ligand
-                        rec_bound_atoms_index = rec.neighbor_atoms(rec_atom['idx'])
-                        if any(rec_bound_atoms_index):
-                            rec_bound_atoms = rec.atoms(rec_bound_atoms_index[0])
-                            # This is not accurate when bonds don't have the same length
-                            rec_hb_pre_position = np.mean(rec_bound_atoms['xyz'], axis=0)
-                        else:
-                            # If no atom bound, likely a water molecule in the receptor
-                            rec_hb_pre_position = None
-
-                        if lig_hb_pre_position is not None:
-                            angle_1 = _compute_angle(lig_atom['xyz'] - lig_hb_pre_position, lig_atom['xyz'] - rec_atom['xyz'])
-                        else:
-                            angle_1 = np.radians(180)
-
-                        if rec_hb_pre_position is not None:
-                            angle_2 = _compute_angle(rec_atom['xyz'] - rec_hb_pre_position, rec_atom['xyz'] - lig_atom['xyz'])
-                        else:
-                            angle_2 = np.radians(180)
-
-                        if (angle_1 >= self._angles[0]) & (angle_2 >= self._angles[1]):
-                            tmp = [lig_atom['idx'], rec_atom['idx'], distance]
-                            if lig_atom_property == 'hb_don':
-                                tmp += [np.degrees(angle_1), np.degrees(angle_2)]
-                            else:
-                                tmp += [np.degrees(angle_2), np.degrees(angle_1)]
-
-                            if rec_type == 'rigid':
-                                rigid_interactions.append(tuple(tmp))
-                            else:
-                                flex_interactions.append(tuple(tmp))
+            lig_indices = ligand.indices_by_properties(['ligand', lig_atom_property])
+
+        if lig_indices.size == 0:
+            return np.array([], dtype=dtype), np.array([], dtype=dtype)
+
+        lig_positions = ligand.coordinates[lig_indices]
+
+        # Get pre-acceptor position (if acceptor) or pre-hydrogen position (if donor) for each atom in the ligand
+        lig_hb_pre_positions, lig_has_pre_position = self._hb_pre_positions(ligand, lig_indices)
+
+        # Get all the neighbors at once, one KDTree query for all the ligand atoms
+        rigid_neighbors = receptor.closest_atom_indices_from_positions(lig_positions, self._distance, rec_atom_property)
+        rec_pre_positions, rec_has_pre_position = self._receptor_hb_pre_positions(receptor)
+        rigid_interactions = self._find_pairs(lig_indices, lig_positions, lig_hb_pre_positions, lig_has_pre_position,
+                                              receptor, rigid_neighbors, rec_pre_positions, rec_has_pre_position)
+
+        flex_interactions = []
+        if has_flexible_residues:
+            flex_neighbors = ligand.closest_atom_indices_from_positions(lig_positions, self._distance, ['flexible_residue', rec_atom_property])
+            flex_interactions = self._find_pairs(lig_indices, lig_positions, lig_hb_pre_positions, lig_has_pre_position,
+                                                 ligand, flex_neighbors)
 
         return np.array(rigid_interactions, dtype=dtype), np.array(flex_interactions, dtype=dtype)
 
+    def _hb_pre_positions(self, rec, atom_idx):
+        """Compute the pre-acceptor/pre-hydrogen position for each atom.
+
+        Returns a (N, 3) array of positions and a (N,) boolean array telling
+        which atoms actually have one (atoms without bound atoms, like water
+        molecules, do not).
+
+        """
+        pre_positions = np.zeros((len(atom_idx), 3))
+
+        # One neighbor lookup for all the atoms, then average the bound atom
+        # positions segment by segment instead of atom by atom
+        bound_atoms_index = rec.neighbor_atoms(atom_idx)
+        counts = np.array([len(bound) for bound in bound_atoms_index])
+        # If no atom bound, likely a water molecule
+        has_pre_position = counts > 0
+
+        if np.any(has_pre_position):
+            flat_index = np.concatenate([bound for bound in bound_atoms_index if bound])
+            bound_positions = rec.coordinates[flat_index]
+            segment_ends = np.cumsum(counts[has_pre_position])
+            segment_starts = segment_ends - counts[has_pre_position]
+            # This is not accurate when bonds don't have the same length
+            sums = np.add.reduceat(bound_positions, segment_starts, axis=0)
+            pre_positions[has_pre_position] = sums / counts[has_pre_position][:, None]
+
+        return pre_positions, has_pre_position
+
+    def _receptor_hb_pre_positions(self, receptor):
+        """Return the pre-acceptor/pre-hydrogen positions of all the receptor
+        atoms, indexed by absolute atom index.
+
+        The receptor topology is static, so the positions are computed once
+        for all its hb_acc/hb_don atoms and cached across poses.
+
+        """
+        if self._rec_pre_positions is None or self._rec_pre_positions[0] is not receptor:
+            rec_indices = receptor.indices_by_properties(self._atom_properties[1])
+            n_atoms = receptor.coordinates.shape[0]
+            pre_positions = np.zeros((n_atoms, 3))
+            has_pre_position = np.zeros(n_atoms, dtype=bool)
+            pre_positions[rec_indices], has_pre_position[rec_indices] = self._hb_pre_positions(receptor, rec_indices)
+            self._rec_pre_positions = (receptor, pre_positions, has_pre_position)
+
+        return self._rec_pre_positions[1], self._rec_pre_positions[2]
+
+    def _find_pairs(self, lig_indices, lig_positions, lig_hb_pre_positions, lig_has_pre_position, rec, neighbors,
+                    rec_pre_positions=None, rec_has_pre_position=None):
+        """Evaluate the hydrogen bond criteria on all the (ligand, receptor)
+        candidate pairs at once."""
+        lig_atom_property = self._atom_properties[0]
+
+        # Turn the per-ligand-atom neighbor lists into two aligned arrays of
+        # candidate pairs
+        pair_lig = np.repeat(np.arange(lig_indices.shape[0]), [len(n) for n in neighbors])
+
+        if pair_lig.size == 0:
+            return []
+
+        pair_rec = np.concatenate(neighbors)
+
+        rec_positions = rec.coordinates
+
+        lig_xyz = lig_positions[pair_lig]
+        rec_xyz = rec_positions[pair_rec]
+
+        # Compare squared distances first, the sqrt is only paid for the
+        # candidates that pass the cutoff
+        lig_to_rec_vectors = lig_xyz - rec_xyz
+        distances_sq = np.einsum('ij,ij->i', lig_to_rec_vectors, lig_to_rec_vectors)
+        within_distance = distances_sq <= self._distance_sq
+
+        if not np.any(within_distance):
+            return []
+
+        pair_lig = pair_lig[within_distance]
+        pair_rec = pair_rec[within_distance]
+        lig_xyz = lig_xyz[within_distance]
+        rec_xyz = rec_xyz[within_distance]
+        distances = np.sqrt(distances_sq[within_distance])
+
+        # Get pre-acceptor position (if acceptor) or pre-hydrogen position
+        # (if donor) of the receptor side atoms. The rigid receptor ones are
+        # precomputed (the topology is static), the flexible sidechain ones
+        # move with the pose and are computed per unique atom here
+        if rec_pre_positions is not None:
+            rec_hb_pre_positions = rec_pre_positions[pair_rec]
+            rec_has_pre_position = rec_has_pre_position[pair_rec]
+        else:
+            unique_rec_idx, pair_to_unique = np.unique(pair_rec, return_inverse=True)
+            unique_pre_positions, unique_has_pre_position = self._hb_pre_positions(rec, unique_rec_idx)
+            rec_hb_pre_positions = unique_pre_positions[pair_to_unique]
+            rec_has_pre_position = unique_has_pre_position[pair_to_unique]
+
+        # Compute the angles of all the candidate pairs in one batch
+        accepted, angles_1, angles_2 = _check_hb_angles(lig_xyz, rec_xyz,
+                                                        lig_hb_pre_positions[pair_lig], lig_has_pre_position[pair_lig],
+                                                        rec_hb_pre_positions, rec_has_pre_position,
+                                                        self._angles[0], self._angles[1])
+
+        # Build the accepted interactions column by column, per-element
+        # ndarray indexing would create one numpy scalar per access
+        lig_idx = lig_indices[pair_lig][accepted].tolist()
+        rec_idx = pair_rec[accepted].tolist()
+        accepted_distances = distances[accepted].tolist()
+        accepted_angles_1 = np.degrees(angles_1[accepted]).tolist()
+        accepted_angles_2 = np.degrees(angles_2[accepted]).tolist()
+
+        if lig_atom_property == 'hb_don':
+            return list(zip(lig_idx, rec_idx, accepted_distances, accepted_angles_1, accepted_angles_2))
+        return list(zip(lig_idx, rec_idx, accepted_distances, accepted_angles_2, accepted_angles_1))
+
 
 class HBDonor(_HBBased):
     def __init__(self, distance=3.5, angles=(120, 90)):
@@ -126,7 +126,7 @@ def _read_ligand_pdbqt_file(pdbqt_string, poses_to_read=-1, energy_range=-1, is_
             resname = line[17:20].strip()
             chainid = line[21].strip()
             resid = int(line[22:26].strip())
-            xyz = np.array([line[30:38].strip(), line[38:46].strip(), line[46:54].strip()], dtype=float)
+            xyz = np.array([line[30:38].strip(), line[38:46].strip(), line[46:54].strip()], dtype=np.float32)
             try:
                 # PDBQT files from dry.py script are stripped from their partial charges. sigh...
                 partial_charges = float(line[71:77].strip())
@@ -279,7 +279,10 @@ def _read_ligand_pdbqt_file(pdbqt_string, poses_to_read=-1, energy_range=-1, is_
         pose_data['active_atoms'].append(tmp_actives)
         pose_data['pdbqt_string'].append(tmp_pdbqt_string)
 
-    positions = np.array(positions).reshape((n_poses, atoms.shape[0], 3))
+    # float32 is enough for docking coordinates (the PDBQT format only has
+    # 3 decimals) and halves the memory traffic of the KDTree queries and
+    # distance/angle computations
+    positions = np.array(positions, dtype=np.float32).reshape((n_poses, atoms.shape[0], 3))
 
     pose_data['n_poses'] = n_poses
 
@@ -363,6 +366,22 @@ class PDBQTMolecule:
         if self._atoms.shape[0] == 0:
             raise RuntimeError('read 0 atoms. Consider PDBQTMolecule.from_file(fname)')
 
+        # Precompute one boolean mask per atom property and per pose (active
+        # atoms), so the hot neighbor searches do not rebuild them at each query
+        self._atom_annotation_masks = {}
+        for atom_property, atom_idx in self._atom_annotations.items():
+            if atom_property == 'mol_index':
+                continue
+            mask = np.zeros(self._atoms.shape[0], dtype=bool)
+            mask[atom_idx] = True
+            self._atom_annotation_masks[atom_property] = mask
+
+        self._active_atom_masks = []
+        for active_atoms_idx in self._pose_data['active_atoms']:
+            mask = np.zeros(self._atoms.shape[0], dtype=bool)
+            mask[active_atoms_idx] = True
+            self._active_atom_masks.append(mask)
+
         # Build KDTrees for each pose (search closest atoms by distance)
         self._KDTrees = [spatial.cKDTree(positions) for positions in self._positions]
 
@@ -514,38 +533,59 @@ class PDBQTMolecule:
         """
         return np.atleast_2d(self.atoms(atom_idx, only_active)['xyz'])
 
-    def atoms_by_properties(self, atom_properties, only_active=True):
-        """Return atom based on their properties
+    @property
+    def coordinates(self):
+        """Coordinates (xyz) of all the atoms in the current pose, as a
+        read-only view (including inactive atoms).
+
+        Unlike positions(), no copy of the atom table is made.
+
+        """
+        return self._positions[self._current_pose]
+
+    def indices_by_properties(self, atom_properties, only_active=True):
+        """Return indices of atoms based on their properties
 
         Args:
-            atom_properties (str or list): property of the atoms to retrieve 
+            atom_properties (str or list): property of the atoms to retrieve
                 (properties: ligand, flexible_residue, vdw, hb_don, hb_acc, metal, water, reactive, glue)
             only_active (bool): return only active atoms (default: True, return only active atoms)
 
+        Returns:
+            ndarray: sorted array of atom indices (0-based)
+
         """
         if not isinstance(atom_properties, (list, tuple)):
             atom_properties = [atom_properties]
 
-        if len(atom_properties) > 1:
-            try:
-                atom_idx = set(self._atom_annotations[atom_properties[0]])
+        if only_active:
+            mask = self._active_atom_masks[self._current_pose]
+        else:
+            mask = np.ones(self._atoms.shape[0], dtype=bool)
 
-                for atom_property in atom_properties[1:]:
-                    atom_idx.intersection_update(self._atom_annotations[atom_property])
-            except:
-                error_msg = 'Atom property %s is not valid. Valid atom properties are: %s'
-                raise KeyError(error_msg % (atom_property, self._atom_annotations.keys()))
+        try:
+            for atom_property in atom_properties:
+                mask = mask & self._atom_annotation_masks[atom_property]
+        except KeyError:
+            error_msg = 'Atom property %s is not valid. Valid atom properties are: %s'
+            raise KeyError(error_msg % (atom_property, self._atom_annotations.keys()))
 
-            atom_idx = list(atom_idx)
-        else:
-            try:
-                atom_idx = self._atom_annotations[atom_properties[0]]
-            except:
-                error_msg = 'Atom property %s is not valid. Valid atom properties are: %s'
-                raise KeyError(error_msg % (atom_properties[0], self._atom_annotations.keys()))
+        return np.flatnonzero(mask)
 
-        if atom_idx:
-            return self.atoms(atom_idx, only_active)
+    def atoms_by_properties(self, atom_properties, only_active=True):
+        """Return atom based on their properties
+
+        Args:
+            atom_properties (str or list): property of the atoms to retrieve
+                (properties: ligand, flexible_residue, vdw, hb_don, hb_acc, metal, water, reactive, glue)
+            only_active (bool): return only active atoms (default: True, return only active atoms)
+
+        """
+        atom_idx = self.indices_by_properties(atom_properties, only_active)
+
+        if atom_idx.size > 0:
+            # The active atoms filtering was already done on the indices
+            return self.atoms(atom_idx, only_active=False)
         else:
             return np.array([])
 
@@ -603,8 +643,46 @@ class PDBQTMolecule:
         else:
             return np.array([])
 
+    def closest_atom_indices_from_positions(self, xyz, radius, atom_properties=None):
+        """Retrieve indices of the closest atoms around each position in the
+        current pose, using a single (batched) KDTree query for all the positions.
+
+        Args:
+            xyz (np.ndarray): array of 3D coordinates (one or multiple positions)
+            radius (float): radius
+            atom_properties (str or list): property of the atoms to retrieve
+                (properties: ligand, flexible_residue, vdw, hb_don, hb_acc, metal, water, reactive, glue)
+
+        Returns:
+            list: list of ndarray of atom indices (0-based), one per input position
+
+        """
+        xyz = np.atleast_2d(xyz)
+        all_indices = self._KDTrees[self._current_pose].query_ball_point(xyz, radius, p=2, workers=-1)
+
+        # Keep only the active atoms in the current pose
+        allowed = self._active_atom_masks[self._current_pose]
+
+        if atom_properties is not None:
+            if not isinstance(atom_properties, (list, tuple)):
+                atom_properties = [atom_properties]
+
+            try:
+                for atom_property in atom_properties:
+                    allowed = allowed & self._atom_annotation_masks[atom_property]
+            except KeyError:
+                error_msg = 'Atom property %s is not valid. Valid atom properties are: %s'
+                raise KeyError(error_msg % (atom_property, self._atom_annotations.keys()))
+
+        results = []
+        for index in all_indices:
+            index = np.asarray(index, dtype=int)
+            results.append(index[allowed[index]])
+
+        return results
+
     def closest_atoms(self, atom_idx, radius, atom_properties=None):
-        """Retrieve indices of the closest atoms around a positions/coordinates 
+        """Retrieve indices of the closest atoms around a positions/coordinates
         at a certain radius.
 
         Args:
@@ -637,17 +715,18 @@ class PDBQTMolecule:
             atom_idx (int, list): index of one or multiple atoms (0-based)
 
         Returns:
-            list_of_list: list of lists containing the neighbor (bonded) atoms (0-based)
+            list_of_list: list of lists containing the neighbor (bonded) atoms
+                (0-based), one per input atom and in the input order, empty
+                for inactive atoms
 
         """
         if not isinstance(atom_idx, (list, tuple, np.ndarray)):
             atom_idx = [atom_idx]
 
         # Get index of only the active atoms
-        active_atoms_idx = self._pose_data['active_atoms'][self._current_pose]
-        atom_idx = list(set(atom_idx).intersection(active_atoms_idx))
+        active_atoms_idx = set(self._pose_data['active_atoms'][self._current_pose])
 
-        return [self._bonds[i] for i in atom_idx]
+        return [self._bonds[i] if i in active_atoms_idx else [] for i in atom_idx]
 
     def write_pdbqt_string(self, as_model=True):
         """Write PDBQT output string of the current pose
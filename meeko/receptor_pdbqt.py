@@ -139,6 +139,13 @@ class PDBQTReceptor:
             pdbqt_string = f.read()
 
         self._atoms, self._atom_annotations = _read_receptor_pdbqt_string(pdbqt_string, skip_typing)
+        # Precompute one boolean mask per atom property, so the hot neighbor
+        # searches do not rebuild them from the annotation lists at each query
+        self._atom_annotation_masks = {}
+        for atom_property, atom_idx in self._atom_annotations.items():
+            mask = np.zeros(self._atoms.shape[0], dtype=bool)
+            mask[atom_idx] = True
+            self._atom_annotation_masks[atom_property] = mask
         # We add to the KDTree only the rigid part of the receptor
         self._KDTree = spatial.cKDTree(self._atoms['xyz'])
         self._bonds = _identify_bonds(self._atom_annotations['all'], self._atoms['xyz'], self._atoms['atom_type'])
@@ -394,6 +401,15 @@ class PDBQTReceptor:
         """
         return np.atleast_2d(self.atoms(atom_idx)['xyz'])
 
+    @property
+    def coordinates(self):
+        """Coordinates (xyz) of all the receptor atoms, as a read-only view.
+
+        Unlike positions(), no copy of the atom table is made.
+
+        """
+        return self._atoms['xyz']
+
     def closest_atoms_from_positions(self, xyz, radius, atom_properties=None, ignore=None):
         """Retrieve indices of the closest atoms around a positions/coordinates
         at a certain radius.
@@ -442,6 +458,68 @@ class PDBQTReceptor:
 
         return atoms
 
+    def indices_by_properties(self, atom_properties):
+        """Return indices of atoms based on their properties
+
+        Args:
+            atom_properties (str or list): property of the atoms to retrieve
+                (properties: ligand, flexible_residue, vdw, hb_don, hb_acc, metal, water, reactive, glue)
+
+        Returns:
+            ndarray: sorted array of atom indices (0-based)
+
+        """
+        if not isinstance(atom_properties, (list, tuple)):
+            atom_properties = [atom_properties]
+
+        mask = np.ones(self._atoms.shape[0], dtype=bool)
+
+        try:
+            for atom_property in atom_properties:
+                mask = mask & self._atom_annotation_masks[atom_property]
+        except KeyError:
+            error_msg = 'Atom property %s is not valid. Valid atom properties are: %s'
+            raise KeyError(error_msg % (atom_property, self._atom_annotations.keys()))
+
+        return np.flatnonzero(mask)
+
+    def closest_atom_indices_from_positions(self, xyz, radius, atom_properties=None):
+        """Retrieve indices of the closest atoms around each position, using
+        a single (batched) KDTree query for all the positions.
+
+        Args:
+            xyz (np.ndarray): array of 3D coordinates (one or multiple positions)
+            radius (float): radius
+            atom_properties (str or list): property of the atoms to retrieve
+                (properties: ligand, flexible_residue, vdw, hb_don, hb_acc, metal, water, reactive, glue)
+
+        Returns:
+            list: list of ndarray of atom indices (0-based), one per input position
+
+        """
+        xyz = np.atleast_2d(xyz)
+        all_indices = self._KDTree.query_ball_point(xyz, radius, p=2, workers=-1)
+
+        allowed = np.ones(self._atoms.shape[0], dtype=bool)
+
+        if atom_properties is not None:
+            if not isinstance(atom_properties, (list, tuple)):
+                atom_properties = [atom_properties]
+
+            try:
+                for atom_property in atom_properties:
+                    allowed = allowed & self._atom_annotation_masks[atom_property]
+            except KeyError:
+                error_msg = 'Atom property %s is not valid. Valid atom properties are: %s'
+                raise KeyError(error_msg % (atom_property, self._atom_annotations.keys()))
+
+        results = []
+        for index in all_indices:
+            index = np.asarray(index, dtype=int)
+            results.append(index[allowed[index]])
+
+        return results
+
     def closest_atoms(self, atom_idx, radius, atom_properties=None):
         """Retrieve indices of the closest atoms around a positions/coordinates
         at a certain radius.
@@ -0,0 +1,42 @@
+from meeko import PDBQTMolecule
+from meeko import PDBQTReceptor
+from meeko.analysis import HBAcceptor, WaterDonor, WaterAcceptor
+import pathlib
+
+workdir = pathlib.Path(__file__)
+datadir = workdir.parents[0] / "rdkitmol_from_docking_data"
+receptor_filename = workdir.parents[1] / "example" / "hydrated_docking" / "protein.pdbqt"
+
+
+def flex_pairs(interaction, pose, receptor):
+    _, flex_interactions = interaction.find(pose, receptor)
+    return sorted((int(lig_idx), int(rec_idx))
+                  for lig_idx, rec_idx in zip(flex_interactions['ligand_idx'],
+                                              flex_interactions['receptor_idx']))
+
+
+def test_flex_hb_acceptor_arg_his():
+    # Regression test: the batched neighbor_atoms() lookup must preserve the
+    # input atom order, otherwise atoms get each other's pre-acceptor or
+    # pre-hydrogen positions and real hydrogen bonds are dropped
+    receptor = PDBQTReceptor(str(receptor_filename))
+    mol = PDBQTMolecule.from_file(str(datadir / "arg_his.pdbqt"))
+    expected = {0: [(11, 35), (11, 42)], 1: [(19, 35), (19, 42)], 8: [(20, 40)]}
+    interaction = HBAcceptor()
+    for pose in mol:
+        pairs = flex_pairs(interaction, pose, receptor)
+        assert(pairs == expected.get(pose.pose_id, []))
+
+
+def test_flex_water_arg_gln_asn_phe():
+    receptor = PDBQTReceptor(str(receptor_filename))
+    mol = PDBQTMolecule.from_file(str(datadir / "arg_gln_asn_phe_badphe.pdbqt"))
+    expected_donor = {0: [(5, 14)], 3: [(4, 14), (4, 34)]}
+    expected_acceptor = {0: [(3, 27)]}
+    water_donor = WaterDonor()
+    water_acceptor = WaterAcceptor()
+    for pose in mol:
+        donor_pairs = flex_pairs(water_donor, pose, receptor)
+        assert(donor_pairs == expected_donor.get(pose.pose_id, []))
+        acceptor_pairs = flex_pairs(water_acceptor, pose, receptor)
+        assert(acceptor_pairs == expected_acceptor.get(pose.pose_id, []))